@@ -1,80 +1,184 @@
+import os
+import time
+import hashlib
+import functools
 import logging
+import mimetypes
+from logging.handlers import MemoryHandler, RotatingFileHandler
 
-from apistar import ASyncApp, Route, App, http
+from apistar import ASyncApp, Route, http
+from jinja2 import Environment, FileSystemLoader
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from main import ZWaveComponent
 from zwave_mqtt_bridge.bridge import Bridge
 
-logging.basicConfig(level=logging.DEBUG,
-                    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
-                    datefmt='%m-%d %H:%M',
-                    filename='zwave-gate.log',
-                    filemode='w')
+
+def setup_logging(filename: str = 'zwave-gate.log'):
+    """
+    Log to rotating file through a memory buffer, records are written in batches or right away from WARNING up
+    """
+    root = logging.getLogger()
+    if any(isinstance(h, MemoryHandler) for h in root.handlers):
+        return
+    file_handler = RotatingFileHandler(filename, maxBytes=8000000, backupCount=3)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+                                                datefmt='%m-%d %H:%M'))
+    root.setLevel(logging.DEBUG)
+    root.addHandler(MemoryHandler(capacity=256, flushLevel=logging.WARNING, target=file_handler))
+
+
+setup_logging(os.environ.get("ZWAVE_LOG_FILE", "zwave-gate.log"))
 _log = logging.getLogger("main")
 
 
-def index(app: App, bridge: Bridge):
-    try:
-        nodes = bridge.nodes()
-        return app.render_template('index.html', nodes=nodes, network=bridge.zw_network)
-    except Exception as e:
-        _log.warning("Could not show index", e)
+class JSONResponse(http.JSONResponse):
+    """
+    JSON response encoded with orjson when it is installed
+    """
+    def render(self, content):
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content)
+
+
+def safe_handler(fn):
+    """
+    Log handler failures and answer with an error response instead of an empty page
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            _log.warning("Handler %s failed", fn.__name__, exc_info=e)
+            return JSONResponse({"error": "internal"}, status_code=500)
+    return wrapper
 
 
-def _r(app: App, bridge: Bridge, r_node: str, page: str):
-    try:
-        node = bridge.nodes().get(r_node)
-        if not node:
-            for n in bridge.nodes().values():
-                if str(n.id()) == r_node:
-                    node = n
-                    break
-        if not node:
-            return http.JSONResponse({"error": "not_found",
-                                      "requested_node": r_node,
-                                      "available_nodes": bridge.nodes().keys()},
-                                     status_code=404)
-        return app.render_template('node%s.html' % page, node=node)
-    except Exception as e:
-        _log.warning("Could not show index", e)
+# Templates are compiled once at import, auto_reload is disabled to skip per-request stat() of template files.
+# Autoescaping stays on as with the ApiStar template renderer, node names and values are device supplied.
+_env = Environment(loader=FileSystemLoader("templates"), autoescape=True, auto_reload=False, cache_size=-1)
+_templates = {name: _env.get_template(name) for name in _env.list_templates(extensions=["html"])}
+
+
+def _render(name: str, **context) -> str:
+    return _templates[name].render(**context)
+
+
+def _load_static(static_dir: str) -> dict:
+    """
+    Read all static assets into memory
+    :return: Dict of relative path => (content, etag, content type)
+    """
+    files = {}
+    for root, _, names in os.walk(static_dir):
+        for name in names:
+            full_path = os.path.join(root, name)
+            with open(full_path, "rb") as f:
+                data = f.read()
+            etag = '"%s"' % hashlib.blake2b(data, digest_size=8).hexdigest()
+            content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            files[os.path.relpath(full_path, static_dir).replace(os.sep, "/")] = (data, etag, content_type)
+    return files
+
+
+# Static files can be left to a front-end server (see example_nginx.conf) with SERVE_STATIC=0
+SERVE_STATIC = os.environ.get("SERVE_STATIC", "1") != "0"
+_static = _load_static("static") if SERVE_STATIC else {}
 
 
-def route_node(app: App, bridge: Bridge, r_node: str):
-    return _r(app, bridge, r_node, "")
+def static(path: str, if_none_match: http.Header):
+    entry = _static.get(path)
+    if not entry:
+        return JSONResponse({"error": "not_found", "requested_file": path}, status_code=404)
+    data, etag, content_type = entry
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000"}
+    if if_none_match == etag:
+        return http.Response(b"", status_code=304, headers=headers)
+    headers["Content-Type"] = content_type
+    return http.Response(data, headers=headers)
 
 
-def route_commands(app: App, bridge: Bridge, r_node: str):
-    return _r(app, bridge, r_node, "_commands")
+# Rendered pages by key => (version, etag, html, render time), re-rendered only when bridge state version changes
+_page_cache = {}
+# Bridge state version restarts from zero, tags of a previous process must not match
+_PROCESS_TAG = "%x" % int(time.time())
+# Pages which change on nearly every value update are kept for this long (s) even if the version moves
+METRICS_TTL = 1.0
 
 
-def route_config(app: App, bridge: Bridge, r_node: str):
-    return _r(app, bridge, r_node, "_config")
+def _cached_page(key, version, if_none_match: str, render_f, ttl: float = 0) -> http.Response:
+    cached = _page_cache.get(key)
+    now = time.monotonic()
+    if not cached or (cached[0] != version and now - cached[3] >= ttl):
+        etag = 'W/"%s-%s-%s"' % (_PROCESS_TAG, "-".join(str(v) for v in version), "-".join(str(k) for k in key))
+        cached = (version, etag, render_f(), now)
+        _page_cache[key] = cached
+    _, etag, html, _ = cached
+    if if_none_match == etag:
+        return http.Response(b"", status_code=304, headers={"ETag": etag})
+    return http.HTMLResponse(html, headers={"ETag": etag})
 
 
-def route_metrics(app: App, bridge: Bridge, r_node: str):
-    return _r(app, bridge, r_node, "_metrics")
+@safe_handler
+def index(bridge: Bridge, if_none_match: http.Header):
+    version = (bridge.cache_version, bridge.zw_network.state)
+    return _cached_page(("index",), version, if_none_match,
+                        lambda: _render('index.html', nodes=bridge.nodes(), network=bridge.zw_network))
+
+
+@safe_handler
+def _r(bridge: Bridge, r_node: str, page: str, if_none_match: str, ttl: float = 0):
+    node = bridge.get_node(r_node)
+    if not node:
+        return JSONResponse({"error": "not_found",
+                             "requested_node": r_node,
+                             "available_nodes": list(bridge.nodes().keys())},
+                            status_code=404)
+    return _cached_page((node.id(), page), (bridge.cache_version,), if_none_match,
+                        lambda: _render('node%s.html' % page, node=node), ttl)
+
+
+def route_node(bridge: Bridge, r_node: str, if_none_match: http.Header):
+    return _r(bridge, r_node, "", if_none_match)
+
+
+def route_commands(bridge: Bridge, r_node: str, if_none_match: http.Header):
+    return _r(bridge, r_node, "_commands", if_none_match)
+
+
+def route_config(bridge: Bridge, r_node: str, if_none_match: http.Header):
+    return _r(bridge, r_node, "_config", if_none_match)
+
+
+def route_metrics(bridge: Bridge, r_node: str, if_none_match: http.Header):
+    return _r(bridge, r_node, "_metrics", if_none_match, METRICS_TTL)
 
 
 def set_config(bridge: Bridge, node_id: int, value_id: int, value: str):
     try:
-        bridge.set_config(node_id, value_id, value)
+        found = bridge.set_config(node_id, value_id, value)
     except Exception as e:
         _log.error(e)
         raise e
-    return {"msg": "Setting done"}
+    if not found:
+        return JSONResponse({"error": "not_found", "requested_node": node_id}, status_code=404)
+    return JSONResponse({"msg": "Setting done"})
 
 
 def push_configs(bridge: Bridge):
     bridge.register_all()
-    return {"msg": "All nodes registered to HA"}
+    return JSONResponse({"msg": "All nodes registered to HA"})
 
 
+@safe_handler
 def html_node_cmd(action, node_id, result_f):
-    try:
-        return app.render_template('node_cmd.html', action=action, node_id=node_id, result=result_f())
-    except Exception as e:
-        _log.warning("Could not show index", e)
-    return {"msg": "Error"}
+    return _render('node_cmd.html', action=action, node_id=node_id, result=result_f())
 
 
 def heal_node(bridge: Bridge, node_id: int):
@@ -83,17 +187,17 @@ def heal_node(bridge: Bridge, node_id: int):
 
 def add_node(bridge: Bridge):
     r = bridge.add_node()
-    return {"msg": "Waiting to add node (%r)" % r}
+    return JSONResponse({"msg": f"Waiting to add node ({r!r})"})
 
 
 def remove_node(bridge: Bridge):
-    r = bridge.zw_network.controller.remove_node()
-    return {"msg": "Waiting to remove node (%r)" % r}
+    r = bridge.remove_node()
+    return JSONResponse({"msg": f"Waiting to remove node ({r!r})"})
 
 
 def rename_node(bridge: Bridge, node_id: int, name: str):
     r = bridge.rename_node(node_id, name)
-    return {"msg": "Renamed (%r)" % r}
+    return JSONResponse({"msg": f"Renamed ({r!r})"})
 
 
 def network_update(bridge: Bridge, node_id: int):
@@ -105,22 +209,22 @@ def neighbor_update(bridge: Bridge, node_id: int):
 
 
 def remove_faulty_node(bridge: Bridge, node_id: int):
-    return html_node_cmd("Remove Faulty Node", node_id, lambda: bridge.zw_network.controller.remove_failed_node(node_id))
+    return html_node_cmd("Remove Faulty Node", node_id, lambda: bridge.remove_failed_node(node_id))
 
 
 def heal_network(bridge: Bridge):
     bridge.network_heal()
-    return {"msg": "Setting done"}
+    return JSONResponse({"msg": "Setting done"})
 
 
 def write_config(bridge: Bridge):
     bridge.write_config()
-    return {"msg": "Setting done"}
+    return JSONResponse({"msg": "Setting done"})
 
 
 def update_config(bridge: Bridge):
     r = bridge.update_config()
-    return {"msg": "%r" % r}
+    return JSONResponse({"msg": f"{r!r}"})
 
 
 def refresh_info(bridge: Bridge, node_id: int):
@@ -148,11 +252,14 @@ routes = [
     Route('/ha/register', 'POST', push_configs),
 ]
 
+if SERVE_STATIC:
+    # Named apart from ApiStar's own "static" route (added for the docs), which would otherwise take over the lookup
+    routes.append(Route('/static/{+path}', 'GET', static, name='static_cached', documented=False))
+
 _log.info("Creating application")
 app = ASyncApp(routes=routes,
                components=[ZWaveComponent()],
-               template_dir="templates",
-               static_dir="static")
+               template_dir="templates")
 
 if __name__ == '__main__':
     _log.info("Starting app")
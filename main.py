@@ -1,3 +1,4 @@
+import os
 import time
 import logging
 import yaml
@@ -10,11 +11,50 @@ from openzwave.option import ZWaveOption
 from pydispatch import dispatcher
 
 from zwave_mqtt_bridge.bridge import Bridge
-from zwave_mqtt_bridge.hass_mqtt import HassMqtt
+from zwave_mqtt_bridge.hass_mqtt import get_hass_mqtt
 
 
 LOG = logging.getLogger("bridge")
 
+# libyaml backed loader is considerably faster, fall back to pure Python one when not compiled in
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_config_cache = {}
+
+
+def load_config(config_file: str) -> dict:
+    """
+    Load YAML configuration, parsed result is reused until the file is modified
+    :param config_file: Path to configuration
+    :return: Configuration as dict
+    """
+    mtime = os.path.getmtime(config_file)
+    cached = _config_cache.get(config_file)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(config_file, "rb") as f:
+        data = yaml.load(f, Loader=_YAML_LOADER) or {}
+    _config_cache[config_file] = (mtime, data)
+    return data
+
+
+# Dispatcher receivers registered by the latest ZWaveComponent as (receiver, signal)
+_connected = []
+
+
+def _connect(receiver, signal):
+    """
+    Connect receiver strongly and remember it, so a rebuilt component can drop the old registrations
+    """
+    if (receiver, signal) not in _connected:
+        dispatcher.connect(receiver, signal, weak=False)
+        _connected.append((receiver, signal))
+
+
+def _disconnect_all():
+    while _connected:
+        receiver, signal = _connected.pop()
+        dispatcher.disconnect(receiver, signal, weak=False)
+
 
 class ZWaveComponent(Component):
     preload = True
@@ -25,12 +65,10 @@ class ZWaveComponent(Component):
     def loop(self):
         try:
             for i in range(0, 300):
-                if self.zw_network.state >= self.zw_network.STATE_AWAKED:
+                if self._awaked.wait(5.0) or self.zw_network.state >= self.zw_network.STATE_AWAKED:
                     LOG.info("Network is ready (or actually AWAKED, but should be ok)")
                     break
-                else:
-                    time.sleep(5.0)
-                    LOG.info("Waiting.. (%i s). State: %s", i*5, self.zw_network.state_str)
+                LOG.info("Waiting.. (%i s). State: %s", (i + 1) * 5, self.zw_network.state_str)
             LOG.info("Starting run..")
             time.sleep(1)
             LOG.info("Registering all..")
@@ -53,8 +91,9 @@ class ZWaveComponent(Component):
 
     def __init__(self):
         Component.__init__(self)
+        self._awaked = threading.Event()
         config_file = "config.yaml"
-        data = yaml.load(open(config_file))
+        data = load_config(config_file)
         config_path = data.get("zwave", {}).get("config")
         device = data.get("zwave", {}).get("device")
         ignored_labels = data.get("bridge", {}).get("ignored", [])
@@ -66,7 +105,7 @@ class ZWaveComponent(Component):
             LOG.warning("Configuration is invalid, please see examples for reference")
             sys.exit(-1)
 
-        mqtt = HassMqtt("zwave", mqtt_host, user, password)
+        mqtt = get_hass_mqtt("zwave", mqtt_host, user, password)
         zw_service = Bridge(mqtt, ignored_labels)
 
         options = ZWaveOption(device, config_path=config_path, user_path=".", cmd_line="")
@@ -78,13 +117,20 @@ class ZWaveComponent(Component):
         options.lock()
         zw_network = ZWaveNetwork(options, log=None)
 
+        def network_awaked(network):
+            LOG.info("Network awaked, %d nodes", network.nodes_count)
+            self._awaked.set()
+
         def network_ready(network):
             LOG.info("Network ready, %d nodes ready", network.nodes_count)
+            self._awaked.set()
 
         def network_failed(network):
             LOG.info("Network failed to load. Found %d nodes", network.nodes_count)
 
         def signal_notification(args):
+            # Node failed / sleeping / awake states are shown on the pages
+            zw_service.cache_version += 1
             if args.get("notificationCode") == 1:
                 LOG.warning("Error communicating with node %r", args.get("nodeId"))
             else:
@@ -95,13 +141,15 @@ class ZWaveComponent(Component):
 
         def network_started(network):
             LOG.info("Network started. Found %d nodes.", network.nodes_count)
-            dispatcher.connect(zw_service.value_update, ZWaveNetwork.SIGNAL_VALUE)
+            _connect(zw_service.value_update, ZWaveNetwork.SIGNAL_VALUE)
 
-        dispatcher.connect(signal_notification, ZWaveNetwork.SIGNAL_NOTIFICATION)
-        dispatcher.connect(controller_command, ZWaveNetwork.SIGNAL_CONTROLLER_COMMAND)
-        dispatcher.connect(network_started, ZWaveNetwork.SIGNAL_NETWORK_STARTED)
-        dispatcher.connect(network_failed, ZWaveNetwork.SIGNAL_NETWORK_FAILED)
-        dispatcher.connect(network_ready, ZWaveNetwork.SIGNAL_NETWORK_READY)
+        _disconnect_all()
+        _connect(signal_notification, ZWaveNetwork.SIGNAL_NOTIFICATION)
+        _connect(controller_command, ZWaveNetwork.SIGNAL_CONTROLLER_COMMAND)
+        _connect(network_started, ZWaveNetwork.SIGNAL_NETWORK_STARTED)
+        _connect(network_failed, ZWaveNetwork.SIGNAL_NETWORK_FAILED)
+        _connect(network_awaked, ZWaveNetwork.SIGNAL_NETWORK_AWAKED)
+        _connect(network_ready, ZWaveNetwork.SIGNAL_NETWORK_READY)
 
         LOG.info("*"*30)
         LOG.info("Starting network..")
@@ -111,9 +159,10 @@ class ZWaveComponent(Component):
 
         zw_network.start()
         LOG.info("Starting monitoring thread..")
-        self.loop()
-        #self.t = threading.Thread(target=self.loop)
-        #self.t.start()
+        # Waiting for the network must not block application startup. The component is created at import,
+        # before the server has set up its event loop, so the wait runs in its own thread.
+        self.t = threading.Thread(target=self.loop, name="zwave-startup", daemon=True)
+        self.t.start()
 
 
 def init_zwave_component():
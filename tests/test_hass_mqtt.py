@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("paho.mqtt.client")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zwave_mqtt_bridge import hass_mqtt
+from zwave_mqtt_bridge.hass_mqtt import HassMqtt
+
+
+class FakeClient:
+    """
+    Records what would be sent to the broker
+    """
+    def __init__(self, client_id=None, clean_session=True):
+        self.published = []
+        self.subscribed = []
+
+    def enable_logger(self, logger):
+        pass
+
+    def username_pw_set(self, username, password):
+        pass
+
+    def reconnect_delay_set(self, min_delay, max_delay):
+        pass
+
+    def connect(self, host, keepalive=60):
+        pass
+
+    def loop_start(self):
+        pass
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, payload, retain))
+
+    def subscribe(self, topic):
+        self.subscribed.append(topic)
+
+
+@pytest.fixture
+def mqtt(monkeypatch):
+    monkeypatch.setattr(hass_mqtt.mqtt, "Client", FakeClient)
+    return HassMqtt("test", "localhost", None, None)
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_metrics_within_window_are_merged(mqtt, monkeypatch):
+    monkeypatch.setattr(hass_mqtt, "METRICS_FLUSH_DELAY", 0.5)
+    sensor = mqtt.register_metrics("house", "node")
+    published = mqtt._mqttc.published
+    mqtt.send_metrics(sensor, {"temperature": 21.5})
+    _wait_for(lambda: len(published) == 1)
+    mqtt.send_metrics(sensor, {"temperature": 22.0})
+    mqtt.send_metrics(sensor, {"humidity": 40})
+    _wait_for(lambda: len(published) == 2)
+    topic, payload, retain = published[1]
+    assert topic == sensor.status_metric
+    assert payload == hass_mqtt._dumps({"temperature": "22.00", "humidity": 40})
+    assert retain is hass_mqtt.RETAIN_METRICS
+    time.sleep(0.6)
+    assert len(published) == 2
+
+
+def test_metrics_flushed_during_batch_are_sent_on_exit(mqtt):
+    sensor = mqtt.register_metrics("house", "node")
+    published = mqtt._mqttc.published
+    with mqtt.batch():
+        mqtt.register("house/switch/node/switch/set", object())
+        mqtt.send_metrics(sensor, {"battery": 90})
+        _wait_for(lambda: not mqtt._pending_metrics and not mqtt._metrics_ready.is_set())
+        time.sleep(0.05)
+        assert published == []
+        assert mqtt._mqttc.subscribed == []
+    assert mqtt._mqttc.subscribed == [[("house/switch/node/switch/set", 0)]]
+    assert [p[0] for p in published] == [sensor.status_metric]
+
+
+def test_unchanged_state_is_published_once(mqtt):
+    published = mqtt._mqttc.published
+    mqtt.publish_switch("house/switch/node/switch/status", True)
+    mqtt.publish_switch("house/switch/node/switch/status", True)
+    mqtt.publish_switch("house/switch/node/switch/status", False)
+    mqtt.publish_light_state("house/light/node/level/status", brightness=128)
+    mqtt.publish_light_state("house/light/node/level/status", brightness=128)
+    assert [(t, p) for t, p, _ in published] == [
+        ("house/switch/node/switch/status", hass_mqtt.PAYLOAD_ON),
+        ("house/switch/node/switch/status", hass_mqtt.PAYLOAD_OFF),
+        ("house/light/node/level/status", hass_mqtt._encode_light_state(128, None)),
+    ]
@@ -0,0 +1,81 @@
+import os
+import sys
+import types
+import logging
+import importlib
+
+import pytest
+
+pytest.importorskip("apistar")
+pytest.importorskip("jinja2")
+pytest.importorskip("pydispatch")
+
+from apistar import Component, test
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _fake_openzwave(monkeypatch):
+    """
+    Minimal openzwave modules, static files need no Z-Wave network
+    """
+    signals = ("SIGNAL_VALUE", "SIGNAL_NOTIFICATION", "SIGNAL_CONTROLLER_COMMAND", "SIGNAL_NETWORK_STARTED",
+               "SIGNAL_NETWORK_FAILED", "SIGNAL_NETWORK_AWAKED", "SIGNAL_NETWORK_READY")
+    classes = {"node": ("ZWaveNode", "ZWaveValue"), "value": ("ZWaveValue",), "network": ("ZWaveNetwork",),
+               "option": ("ZWaveOption",)}
+    monkeypatch.setitem(sys.modules, "openzwave", types.ModuleType("openzwave"))
+    for name, class_names in classes.items():
+        module = types.ModuleType("openzwave." + name)
+        for class_name in class_names:
+            setattr(module, class_name, type(class_name, (), {s: s for s in signals}))
+        monkeypatch.setitem(sys.modules, module.__name__, module)
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setenv("ZWAVE_LOG_FILE", str(tmp_path / "zwave-gate.log"))
+    _fake_openzwave(monkeypatch)
+    modules_before = set(sys.modules)
+    handlers_before = list(logging.getLogger().handlers)
+
+    import main
+    from zwave_mqtt_bridge.bridge import Bridge
+
+    class NoZWaveComponent(Component):
+        def resolve(self) -> Bridge:
+            return None
+
+    monkeypatch.setattr(main, "ZWaveComponent", NoZWaveComponent)
+    app = importlib.import_module("app")
+    yield test.TestClient(app.app)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if handler not in handlers_before:
+            root.removeHandler(handler)
+            handler.close()
+    for name in set(sys.modules) - modules_before:
+        del sys.modules[name]
+
+
+def test_static_file(client):
+    response = client.get("/static/dash.css")
+    assert response.status_code == 200
+    with open(os.path.join(ROOT, "static", "dash.css"), "rb") as f:
+        assert response.content == f.read()
+    assert response.headers["Content-Type"] == "text/css"
+    assert response.headers["ETag"]
+
+
+def test_static_file_not_modified(client):
+    etag = client.get("/static/dash.css").headers["ETag"]
+    response = client.get("/static/dash.css", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+
+def test_static_file_missing(client):
+    assert client.get("/static/missing.css").status_code == 404
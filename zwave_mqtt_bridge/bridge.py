@@ -1,3 +1,4 @@
+import sys
 import json
 import time
 import logging
@@ -13,43 +14,67 @@ from zwave_mqtt_bridge.zw_node import ZwNode
 
 DEBUG = True
 
-logging.basicConfig(level=logging.DEBUG,
-                    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
-                    datefmt='%m-%d %H:%M',
-                    filename='zwave-gate.log',
-                    filemode='w')
 _log = logging.getLogger("bridge")
 
+# Value genres, values are interned on arrival so genres can be compared by identity
+GENRE_USER = sys.intern("User")
+GENRES_NOT_HANDLED = frozenset(sys.intern(g) for g in ("System", "Config", "Basic"))
+
 
 class Bridge:
 
     def __init__(self, mqtt: HassMqtt, ignored_labels: List):
-        self._ignored_labels = ignored_labels
+        self._ignored_labels = frozenset(label.lower() for label in ignored_labels)
+        self._label_lc_cache = {}  # type: Dict[str, str]
         self._mqtt = mqtt
         self._nodes = {}  # type: Dict[str, ZwNode]
+        self._nodes_by_id = {}  # type: Dict[int, ZwNode]
         self._last_config = 0
-        self._log = logging.getLogger("zwbridge")
         self._repair_time = 0
-        self._last_repair_attempt = 0
+        # Repair check is only evaluated every 256th value update, first update included
+        self._repair_counter = -1
+        self._next_repair_check = 0.0
         self._healing = False
         self.zw_network = None
+        self.cache_version = 0
         #self._repair_time = int(time.time() / (24*60*60))
 
     def _find_node(self, node_id: int) -> Union[ZwNode, None]:
-        for i in self._nodes.values():
-            if i.id() == node_id:
-                return i
-        return None
-
-    def set_config(self, node_id: int, config_id: int, data: str):
-        self._find_node(node_id).set_config(int(config_id), json.loads(data))
+        return self._nodes_by_id.get(int(node_id))
+
+    def set_config(self, node_id: int, config_id: int, data: str) -> bool:
+        """
+        Set node configuration parameter
+        :return: False if node is not known
+        """
+        n = self._find_node(node_id)
+        if n is None:
+            return False
+        self.cache_version += 1
+        n.set_config(config_id, json.loads(data))
+        return True
 
     def nodes(self):
         return self._nodes
 
+    def get_node(self, r_node: str) -> Union[ZwNode, None]:
+        """
+        Resolve node either by name or by node id
+        :param r_node: Node name or id as string
+        :return: Node or None if not found
+        """
+        node = self._nodes.get(r_node)
+        if not node and r_node.isdecimal():
+            node = self._nodes_by_id.get(int(r_node))
+        return node
+
     def check_for_repair(self, network: ZWaveNetwork):
-        if time.time() - self._last_repair_attempt > 5*60:
-            self._last_repair_attempt = time.time()
+        self._repair_counter += 1
+        if self._repair_counter & 0xFF:
+            return
+        now_monotonic = time.monotonic()
+        if now_monotonic >= self._next_repair_check:
+            self._next_repair_check = now_monotonic + 5*60
             if network.is_ready:
                 now = int(time.time() / (24*60*60))
                 if now != self._repair_time:
@@ -66,58 +91,77 @@ class Bridge:
 
     def register_all(self):
         self._last_config = time.time()
-        for node in self._nodes.values():
-            node.register(self._mqtt)
+        self.cache_version += 1
+        with self._mqtt.batch():
+            for node in self._nodes.values():
+                node.register(self._mqtt)
 
     def value_update(self, network: ZWaveNetwork, node: ZWaveNode, value: ZWaveValue):
-        self.check_for_repair(network)
         if self._healing:
-            _log.info("Healing, skipping value update")
+            if _log.isEnabledFor(logging.DEBUG):
+                _log.debug("Healing, skipping value update")
             return
-        n = self._nodes.get(node.name)  # type: ZwNode
-        if not n:
-            self._log.info("New node %s", node)
+        self.check_for_repair(network)
+        self.cache_version += 1
+        name = node.name or str(node.node_id)
+        nodes = self._nodes
+        n = nodes.get(name)  # type: ZwNode
+        if n is None:
+            _log.info("New node %s", node)
             n = ZwNode(node, self._mqtt, self._ignored_labels)
-            name = node.name
-            if node.name == "":
-                name = str(node.node_id)
-            self._nodes[name] = n
-        if value.genre == "User":
+            nodes[name] = n
+            self._nodes_by_id[node.node_id] = n
+        genre = sys.intern(value.genre)
+        label = value.label
+        if genre is GENRE_USER:
             if self._last_config:
-                if value.label.lower() in self._ignored_labels:
+                label_lc = self._label_lc_cache.get(label)
+                if label_lc is None:
+                    label_lc = label.lower()
+                    self._label_lc_cache[label] = label_lc
+                if label_lc in self._ignored_labels:
                     return
-                if n.is_spamming():
+                now = time.monotonic()
+                if n.is_spamming(now):
                     return
-                if not n.update_state(value):
-                    self._log.info("Value update (Command class: %r), %s => %s=%r (NOT HANDLED)", hex(value.command_class),
-                                   n.name(), value.label, value.data)
-        elif value.genre == "System":
-            self._log.debug("System (Command class: %r), %s => %s=%r (NOT HANDLED)", hex(value.command_class),
-                           n.name(), value.label, value.data)
-        elif value.genre == "Config":
-            self._log.debug("Config (Command class: %r), %s => %s=%r (NOT HANDLED)", hex(value.command_class),
-                           n.name(), value.label, value.data)
-        elif value.genre == "Basic":
-            self._log.debug("Basic (Command class: %r), %s => %s=%r (NOT HANDLED)", hex(value.command_class),
-                           n.name(), value.label, value.data)
+                if not n.update_state(value, now) and _log.isEnabledFor(logging.INFO):
+                    _log.info("Value update (Command class: %r), %s => %s=%r (NOT HANDLED)",
+                              hex(value.command_class), n.name(), label, value.data)
+        elif genre in GENRES_NOT_HANDLED:
+            if _log.isEnabledFor(logging.DEBUG):
+                _log.debug("%s (Command class: %r), %s => %s=%r (NOT HANDLED)", genre, hex(value.command_class),
+                           n.name(), label, value.data)
         else:
-            _log.info("Unhandled message of genre %r (%r, %r)", value.genre, value.label, value.data)
+            _log.info("Unhandled message of genre %r (%r, %r)", genre, label, value.data)
 
     def heal(self, node_id):
+        self.cache_version += 1
         self._find_node(node_id)._zwn.heal()
 
     def network_update(self, node_id):
+        self.cache_version += 1
         return self.zw_network.controller.request_network_update(node_id)
 
     def neighbor_update(self, node_id):
+        self.cache_version += 1
         return self.zw_network.controller.request_node_neighbor_update(node_id)
 
     def network_heal(self):
+        self.cache_version += 1
         return self.zw_network.heal()
 
     def add_node(self):
+        self.cache_version += 1
         return self.zw_network.controller.add_node()
 
+    def remove_node(self):
+        self.cache_version += 1
+        return self.zw_network.controller.remove_node()
+
+    def remove_failed_node(self, node_id):
+        self.cache_version += 1
+        return self.zw_network.controller.remove_failed_node(node_id)
+
     def write_config(self):
         return self.zw_network.write_config()
 
@@ -128,4 +172,5 @@ class Bridge:
         pass
 
     def refresh_info(self, node_id):
+        self.cache_version += 1
         return self.zw_network.controller.send_node_information(node_id)
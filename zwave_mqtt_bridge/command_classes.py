@@ -10,5 +10,5 @@ COMMAND_CLASS_METER = 0x32
 COMMAND_CLASS_BATTERY = 0x80
 
 DEVICE_CLASS_SENSOR = "sensor"
-SENSORS = [COMMAND_CLASS_SENSOR_BINARY, COMMAND_CLASS_SENSOR_MULTILEVEL, COMMAND_CLASS_METER, COMMAND_CLASS_BATTERY,
-           COMMAND_CLASS_NOTIFICATION, 0x81, 0x40, 0,43]
+SENSORS = frozenset((COMMAND_CLASS_SENSOR_BINARY, COMMAND_CLASS_SENSOR_MULTILEVEL, COMMAND_CLASS_METER,
+                     COMMAND_CLASS_BATTERY, COMMAND_CLASS_NOTIFICATION, 0x81, 0x40, 0,43))
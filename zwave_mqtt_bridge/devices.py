@@ -6,10 +6,21 @@ from openzwave.node import ZWaveNode, ZWaveValue
 
 _log = logging.getLogger("operations")
 
+# Two digit upper case hex for each color channel value
+_HEX = tuple("%02X" % i for i in range(256))
+# MQTT switch payload => switch state, unknown payloads turn the switch off
+_SWITCH_STATES = {b"ON": True, b"True": True, b"on": True, b"true": True,
+                  b"OFF": False, b"False": False, b"off": False, b"false": False}
+# JSON light command states turning the light on
+_ON_STATES = frozenset(("ON", "True"))
+# Z-Wave dimmer level (0-99) => Home Assistant brightness (0-255)
+_HASS_BRIGHTNESS = tuple(int(v * 255 / 99) for v in range(100))
+
 # TODO: State updates are sometimes received in middle of transition phase, ignore state changes right after action
 
 
 class Device:
+    __slots__ = ("_zwn", "_hass_mqtt", "_zw_id", "_op_type", "name", "label", "topic_command", "topic_status")
 
     def __init__(self, label: str, zwn: ZWaveNode, hass_mqtt: HassMqtt, zw_id: int, op_type: str):
         self._zwn = zwn
@@ -18,9 +29,9 @@ class Device:
         self._op_type = op_type
         self.name = self._zwn.name
         self.label = label
-        location = self._zwn.location
-        self.topic_command = location + "/" + op_type + "/" + self.name + "/" + label + "/set"
-        self.topic_status = location + "/" + op_type + "/" + self.name + "/" + label + "/status"
+        base_topic = f"{self._zwn.location}/{op_type}/{self.name}/{label}"
+        self.topic_command = base_topic + "/set"
+        self.topic_status = base_topic + "/status"
         self._hass_mqtt.register(self.topic_command, self)
 
     def mqtt_message(self, data):
@@ -48,6 +59,7 @@ class Device:
 
 
 class SwitchDevice(Device):
+    __slots__ = ("state",)
 
     def __init__(self, label: str, zwn: ZWaveNode, hass_mqtt: HassMqtt, zw_id: int):
         self.state = zwn.get_switch_state(zw_id)
@@ -55,14 +67,16 @@ class SwitchDevice(Device):
         self._hass_mqtt.publish_switch(self.topic_status, self.state)
 
     def mqtt_message(self, data):
-        toggle = data in [b"ON", b"True"]
-        _log.info("Action [Switch]: %s (%i) => %r", self._zwn.name, self._zw_id, toggle)
+        toggle = _SWITCH_STATES.get(data, False)
+        if _log.isEnabledFor(logging.INFO):
+            _log.info("Action [Switch]: %s (%i) => %r", self._zwn.name, self._zw_id, toggle)
         self._zwn.set_switch(self._zw_id, toggle)
 
     def zwave_message(self, value: ZWaveValue):
         toggle = True if value.data else False
         if toggle != self.state:
-            _log.info("Update [Switch]: %s (%i) => %r", self._zwn.name, self._zw_id, toggle)
+            if _log.isEnabledFor(logging.INFO):
+                _log.info("Update [Switch]: %s (%i) => %r", self._zwn.name, self._zw_id, toggle)
             self.state = toggle
             self._hass_mqtt.publish_switch(self.topic_status, self.state)
 
@@ -72,7 +86,7 @@ class SwitchDevice(Device):
                 "platform": "mqtt",
                 "qos": 0,
                 "optimistic": False,
-                "name": self.name + "_" + self.label,
+                "name": f"{self.name}_{self.label}",
                 "command_topic": self.topic_command,
                 "state_topic": self.topic_status,
                 "payload_on": "ON",
@@ -86,30 +100,31 @@ class SwitchDevice(Device):
 
 
 class DimmerDevice(Device):
+    __slots__ = ("brightness",)
 
     def __init__(self, label: str, zwn: ZWaveNode, hass_mqtt: HassMqtt, zw_id: int):
         self.brightness = zwn.get_dimmer_level(zw_id)
         Device.__init__(self, label, zwn, hass_mqtt, zw_id, "light")
-        self._hass_mqtt.publish_light_state(self.topic_status, brightness=self._hass_brightness(self.brightness))
-
-    def _hass_brightness(self, value: int):
-        return int(value * 255 / 99)
+        self._hass_mqtt.publish_light_state(self.topic_status, brightness=_HASS_BRIGHTNESS[min(self.brightness, 99)])
 
     def zwave_message(self, value: ZWaveValue):
         new_brightness = value.data
         if new_brightness != self.brightness:
-            _log.info("Update [Dimmer]: %s (%i) => %i", self._zwn.name, self._zw_id, new_brightness)
+            if _log.isEnabledFor(logging.INFO):
+                _log.info("Update [Dimmer]: %s (%i) => %i", self._zwn.name, self._zw_id, new_brightness)
             self.brightness = new_brightness
-            self._hass_mqtt.publish_light_state(self.topic_status, brightness=self._hass_brightness(self.brightness))
+            self._hass_mqtt.publish_light_state(self.topic_status,
+                                                brightness=_HASS_BRIGHTNESS[min(self.brightness, 99)])
 
     def mqtt_message(self, data):
         data = json.loads(data.decode("utf8"))
         state = data.get("state")
         brightness = 0
-        if state in ["ON", "True"]:
+        if state in _ON_STATES:
             brightness = int(data.get("brightness", 255) * 99 / 255)
         self._zwn.set_dimmer(self._zw_id, brightness)
-        _log.info("Action [Dimmer]: %s (%i) => %i", self._zwn.name, self._zw_id, brightness)
+        if _log.isEnabledFor(logging.INFO):
+            _log.info("Action [Dimmer]: %s (%i) => %i", self._zwn.name, self._zw_id, brightness)
 
     def generate_config(self):
         return {self._op_type: [
@@ -117,7 +132,7 @@ class DimmerDevice(Device):
                 "platform": "mqtt",
                 "qos": 0,
                 "optimistic": False,
-                "name": self.name + "_" + self.label,
+                "name": f"{self.name}_{self.label}",
                 "command_topic": self.topic_command,
                 "state_topic": self.topic_status,
                 "payload_on": "ON",
@@ -136,6 +151,8 @@ class RgbDevice(Device):
     """
     Z-Wave returns RGBW data in following format: #FFFFFFFF
     """
+    __slots__ = ("rgbw",)
+
     def __init__(self, label: str, zwn: ZWaveNode, hass_mqtt: HassMqtt, zw_id: int):
         self.rgbw = zwn.get_rgbw(zw_id)
         Device.__init__(self, label, zwn, hass_mqtt, zw_id, "light")
@@ -143,15 +160,13 @@ class RgbDevice(Device):
 
     @staticmethod
     def _unwrap_zwave_data(raw):
-        return [int("0x" + raw[1:3], 16),
-                int("0x" + raw[3:5], 16),
-                int("0x" + raw[5:7], 16),
-                int("0x" + raw[7:9], 16)]
+        return list(bytes.fromhex(raw[1:9]))
 
     def zwave_message(self, value: ZWaveValue):
         if value.data != self.rgbw:
             self.rgbw = value.data
-            _log.info("Update [RGB]: %s (%i) => %s", self._zwn.name, self._zw_id, value.data)
+            if _log.isEnabledFor(logging.INFO):
+                _log.info("Update [RGB]: %s (%i) => %s", self._zwn.name, self._zw_id, value.data)
             self._hass_mqtt.publish_rgb_state(self.topic_status, self._unwrap_zwave_data(self.rgbw))
 
     def mqtt_message(self, data):
@@ -160,17 +175,19 @@ class RgbDevice(Device):
         r_color = data.get("color")
         r_white = data.get("white_value")
         r, g, b, w = ["00"] * 4
-        _log.info(data)
-        if state in ["ON", "True"]:
-            r, g, b, w = [self.rgbw[n*2+1:(n+1)*2+1] for n in range(0, 4)]
+        _log.debug("RGB command: %r", data)
+        if state in _ON_STATES:
+            rgbw = self.rgbw
+            r, g, b, w = rgbw[1:3], rgbw[3:5], rgbw[5:7], rgbw[7:9]
             if r_white:
-                w = "{0:#0{1}x}".format(r_white, 4).upper()[2:4]
+                w = _HEX[r_white & 0xFF]
             elif r_color:
-                r, g, b = ["{0:#0{1}x}".format(r_color[k], 4).upper()[2:4] for k in ["r", "g", "b"]]
+                r, g, b = _HEX[r_color["r"] & 0xFF], _HEX[r_color["g"] & 0xFF], _HEX[r_color["b"] & 0xFF]
             else:
                 r, g, b, w = ["FF"] * 4
         color = "#" + r + g + b + w
-        _log.info("Action [RGB]: %s (%i) => %s", self._zwn.name, self._zw_id, color)
+        if _log.isEnabledFor(logging.INFO):
+            _log.info("Action [RGB]: %s (%i) => %s", self._zwn.name, self._zw_id, color)
         self._zwn.set_rgbw(self._zw_id, color)
         # RGBW value can occasionally be reported from transition state, to fight this assume the color is set correctly
         self._hass_mqtt.publish_rgb_state(self.topic_status, self._unwrap_zwave_data(self.rgbw))
@@ -181,7 +198,7 @@ class RgbDevice(Device):
                 "platform": "mqtt",
                 "qos": 0,
                 "optimistic": False,
-                "name": self.name + "_" + self.label,
+                "name": f"{self.name}_{self.label}",
                 "command_topic": self.topic_command,
                 "state_topic": self.topic_status,
                 "payload_on": "ON",
@@ -1,13 +1,82 @@
-from typing import Dict, List
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, List, Tuple
 
 import paho.mqtt.client as mqtt
 import json
 import logging
+import threading
+import time
+
+try:
+    import orjson
+
+    def _dumps(data) -> bytes:
+        return orjson.dumps(data)
+except ImportError:
+    def _dumps(data) -> bytes:
+        return json.dumps(data).encode("utf8")
 
 LOG = logging.getLogger("hass_mqtt")
 
+# After sending metrics, updates arriving within this delay (s) are collected into one message per sensor
+METRICS_FLUSH_DELAY = 0.05
+
+# Retain policy: device states (switch, light) and sensor metrics are retained so Home Assistant gets the last known
+# value on (re)start. Battery sensors report only on change, without retain they would stay unknown for hours.
+RETAIN_METRICS = True
+
+# Switch state payloads
+PAYLOAD_ON = b"ON"
+PAYLOAD_OFF = b"OFF"
+
+
+def _ignore_message(topic: str, payload: bytes):
+    pass
+
+
+def _format_metrics(metric_map: Dict) -> Dict:
+    """
+    Metric values as sent, floats are kept numeric for change detection and formatted to two decimals only here
+    """
+    return {k: "%.2f" % v if type(v) is float else v for k, v in metric_map.items()}
+
+
+@lru_cache(maxsize=1024)
+def _encode_light_state(brightness: int, color: Tuple[int, ...]) -> bytes:
+    if brightness is None:
+        brightness = color[3] if color else 255
+    data = {"state": "OFF" if brightness == 0 else "ON",
+            "brightness": brightness}
+    if color:
+        data["color"] = {
+            "r": color[0],
+            "g": color[1],
+            "b": color[2]
+        }
+        if len(color) == 4:
+            data["white_value"] = color[3]
+    return _dumps(data)
+
+
+@lru_cache(maxsize=1024)
+def _encode_rgb_state(color: Tuple[int, ...]) -> bytes:
+    if sum(color) == 0:
+        data = {"state": "OFF"}
+    else:
+        data = {"state": "ON",
+                "brightness": 255,
+                "color": {"r": color[0],
+                          "g": color[1],
+                          "b": color[2]}
+                }
+        if len(color) == 4:
+            data["white_value"] = color[3]
+    return _dumps(data)
+
 
 class HassBase:
+    __slots__ = ("_name", "_domain", "_platform", "_device_type")
 
     def __init__(self, location: str, device_type: str, name: str, platform: str):
         if not location:
@@ -30,14 +99,16 @@ class HassBase:
 
 
 class HassSensor(HassBase):
+    __slots__ = ("_metrics", "status_metric")
 
     def __init__(self, location: str, name: str):
         HassBase.__init__(self, location, "sensor", name, "mqtt")
-        self._metrics = set()
+        self._metrics = {}  # type: Dict[str, str]
         self.status_metric = "/".join([self._domain, self._device_type, name, "sensor"])
 
     def add_metric(self, metric: str):
-        self._metrics.add(metric)
+        if metric not in self._metrics:
+            self._metrics[metric] = "{{ value_json.%s }}" % metric
 
     def generate_config(self):
         """
@@ -50,55 +121,131 @@ class HassSensor(HassBase):
             unit_of_measurement: '°C'
             value_template: "{{ value_json.temperature }}"
         """
-        data = {"sensor": []}
-        for m in self._metrics:
-            data["sensor"].append({
-                "platform": "mqtt",
-                "name": self._name + "_" + m,
-                "state_topic": self.status_metric,
-                "value_template": "{{ value_json.%s }}" % m
-            })
-        return data
+        return {"sensor": [{
+            "platform": "mqtt",
+            "name": f"{self._name}_{m}",
+            "state_topic": self.status_metric,
+            "value_template": template
+        } for m, template in self._metrics.items()]}
 
 
 class HassMqtt:
     def __init__(self, client_id, host: str, username: str, password: str):
         LOG.info("Initialising MQTT")
-        self._mqttc = mqtt.Client(client_id=client_id)
+        # Called with (topic, payload) for messages on topics without registered listener
+        self.on_message = _ignore_message
+        self._map = {}
+        self._batch = None
+        self._batch_subscribe = None
+        self._batch_lock = threading.Lock()
+        self._last_payload = {}  # type: Dict[str, bytes]
+        self._pending_metrics = {}  # type: Dict[str, Dict]
+        self._metrics_ready = threading.Event()
+        # Single long lived connection, persistent session keeps subscriptions over reconnects
+        self._mqttc = mqtt.Client(client_id=client_id, clean_session=False)
         self._mqttc.enable_logger(LOG)
         if username and password:
             self._mqttc.username_pw_set(username, password)
-        LOG.info("Connecting MQTT")
-        self._mqttc.connect(host)
         self._mqttc.on_message = self._on_message
+        self._mqttc.on_connect = self._on_connect
+        self._mqttc.reconnect_delay_set(min_delay=1, max_delay=30)
+        LOG.info("Connecting MQTT")
+        self._mqttc.connect(host, keepalive=60)
         self._mqttc.loop_start()
-        self.on_message = None
-        self._map = {}
+        # Bound once, client lives as long as this object
+        self._mqtt_publish = self._mqttc.publish
+        self._mqtt_subscribe = self._mqttc.subscribe
+        self._flusher = threading.Thread(target=self._flush_loop, name="mqtt-metrics", daemon=True)
+        self._flusher.start()
         LOG.info("MQTT ready")
 
+    def _on_connect(self, client, userdata, flags, rc):
+        LOG.info("MQTT connected (%r)", rc)
+        if self._map and not flags.get("session present"):
+            client.subscribe([(topic, 0) for topic in self._map.keys()])
+
+    @contextmanager
+    def batch(self):
+        """
+        Collect subscriptions and publishes made inside the block and hand them to the client in one burst when
+        the block exits. Subscriptions are sent as a single SUBSCRIBE packet.
+        """
+        if self._batch is not None:
+            yield
+            return
+        self._batch = []
+        self._batch_subscribe = []
+        try:
+            yield
+        finally:
+            with self._batch_lock:
+                pending, self._batch = self._batch, None
+                subscribe, self._batch_subscribe = self._batch_subscribe, None
+            LOG.debug("Flushing %i batched subscriptions and %i messages", len(subscribe), len(pending))
+            if subscribe:
+                self._mqtt_subscribe([(topic, 0) for topic in subscribe])
+            for topic, payload, retain in pending:
+                self._mqtt_publish(topic, payload, qos=0, retain=retain)
+
+    def _publish(self, topic: str, payload, retain: bool, skip_unchanged: bool = False):
+        if skip_unchanged:
+            if self._last_payload.get(topic) == payload:
+                return
+            self._last_payload[topic] = payload
+        with self._batch_lock:
+            if self._batch is not None:
+                self._batch.append((topic, payload, retain))
+                return
+        self._mqtt_publish(topic, payload, retain=retain)
+
     def _on_message(self, client, userdata, message: mqtt.MQTTMessage):
-        LOG.debug("Topic %r received message %r" % (message.topic, message.payload))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("Topic %r received message %r", message.topic, message.payload)
         route = self._map.get(message.topic)
         if route:
             route.mqtt_message(message.payload)
         else:
-            if self.on_message:
-                self.on_message(message.topic, message.payload)
+            self.on_message(message.topic, message.payload)
 
     def register(self, topic, listener):
         LOG.info("Topic %r registered for %r", topic, listener)
         self._map[topic] = listener
-        self._mqttc.subscribe(topic)
+        with self._batch_lock:
+            if self._batch_subscribe is not None:
+                self._batch_subscribe.append(topic)
+                return
+        self._mqtt_subscribe(topic)
 
     def register_metrics(self, location, name):
-        LOG.info("Setting up sensor: %r / %r" % (name, name))
+        LOG.info("Setting up sensor: %r / %r", location, name)
         topic = HassSensor(location, name)
         return topic
 
     def send_metrics(self, cmd: HassSensor, metric_map: Dict):
+        """
+        Queue metrics for sending. Metrics are sent right away by the flusher thread, metrics for the same sensor
+        arriving within METRICS_FLUSH_DELAY after that are merged into a single message.
+        """
         if cmd and metric_map:
-            #LOG.info("MQTT Metrics send: %r => %r", cmd.status_metric, metric_map)
-            self._mqttc.publish(cmd.status_metric, payload=json.dumps(metric_map), retain=True)
+            with self._batch_lock:
+                self._pending_metrics.setdefault(cmd.status_metric, {}).update(metric_map)
+            self._metrics_ready.set()
+
+    def _flush_loop(self):
+        while True:
+            self._metrics_ready.wait()
+            self._metrics_ready.clear()
+            try:
+                self.flush_metrics()
+            except Exception as e:
+                LOG.warning("Sending metrics failed", exc_info=e)
+            time.sleep(METRICS_FLUSH_DELAY)
+
+    def flush_metrics(self):
+        with self._batch_lock:
+            pending, self._pending_metrics = self._pending_metrics, {}
+        for topic, metric_map in pending.items():
+            self._publish(topic, _dumps(_format_metrics(metric_map)), retain=RETAIN_METRICS)
 
     def publish_light_state(self, topic: str, brightness: int = None, color: List[int] = None):
         """
@@ -121,37 +268,32 @@ class HassMqtt:
               "white_value": 150
             }
         """
-        if brightness is None:
-            brightness = color[3] if color else 255
-        data = {"state": "OFF" if brightness == 0 else "ON",
-                "brightness": brightness}
-        if color:
-            data["color"] = {
-                "r": color[0],
-                "g": color[1],
-                "b": color[2]
-            }
-            if len(color) == 4:
-                data["white_value"] = color[3]
-        LOG.debug("Sending light state: %r = %r", topic, data)
-        self._mqttc.publish(topic, json.dumps(data), retain=True)
+        payload = _encode_light_state(brightness, tuple(color) if color else None)
+        LOG.debug("Sending light state: %r = %r", topic, payload)
+        self._publish(topic, payload, retain=True, skip_unchanged=True)
 
     def publish_rgb_state(self, topic: str, color: List[int]):
-        if sum(color) == 0:
-            data = {"state": "OFF"}
-        else:
-            data = {"state": "ON",
-                    "brightness": 255,
-                    "color": {"r": color[0],
-                              "g": color[1],
-                              "b": color[2]}
-                    }
-            if len(color) == 4:
-                data["white_value"] = color[3]
-        LOG.debug("Sending light state: %r = %r", topic, data)
-        self._mqttc.publish(topic, json.dumps(data), retain=True)
+        payload = _encode_rgb_state(tuple(color))
+        LOG.debug("Sending light state: %r = %r", topic, payload)
+        self._publish(topic, payload, retain=True, skip_unchanged=True)
 
     def publish_switch(self, topic: str, state: bool):
-        data = "OFF" if not state else "ON"
+        data = PAYLOAD_ON if state else PAYLOAD_OFF
         LOG.debug("Publish: %r ==> %r", topic, data)
-        self._mqttc.publish(topic, data, retain=True)
+        self._publish(topic, data, retain=True, skip_unchanged=True)
+
+
+# Clients by (client id, host), a broker only keeps one connection per client id
+_clients = {}  # type: Dict[Tuple[str, str], HassMqtt]
+
+
+def get_hass_mqtt(client_id: str, host: str, username: str, password: str) -> HassMqtt:
+    """
+    Return the existing client for client id and host, or connect a new one
+    """
+    key = (client_id, host)
+    client = _clients.get(key)
+    if client is None:
+        client = HassMqtt(client_id, host, username, password)
+        _clients[key] = client
+    return client
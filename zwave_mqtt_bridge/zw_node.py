@@ -1,26 +1,38 @@
 import itertools
+import sys
 import time
 import logging
 import yaml
-from typing import Dict, List
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Set, Tuple
 from openzwave.node import ZWaveNode
 from openzwave.value import ZWaveValue
-from zwave_mqtt_bridge.command_classes import SENSORS, COMMAND_CLASS_NOTIFICATION
+from zwave_mqtt_bridge.command_classes import SENSORS
 from zwave_mqtt_bridge.devices import SwitchDevice, DimmerDevice, RgbDevice
-from zwave_mqtt_bridge.hass_mqtt import HassMqtt
+from zwave_mqtt_bridge.hass_mqtt import HassMqtt, HassSensor
 
 LOG = logging.getLogger("node")
 
+_YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+# Value data type => metric value. Bools are stored as "1" / "0" like ints, burglar / sensor handling relies on it.
+# Floats are rounded for change detection, HassMqtt formats them to "%.2f" strings when sending.
+_VALUE_CONVERTERS = {float: lambda v: round(v, 2),
+                     int: "%i".__mod__,
+                     bool: "%i".__mod__}
+
 
 class Labels:
+    __slots__ = ("_label_map", "_taken_labels", "_next_suffix")
 
     def __init__(self):
-        self._label_map = {}
-        self._taken_labels = set()
+        self._label_map = {}  # type: Dict[Tuple[int, int], str]
+        self._taken_labels = set()  # type: Set[Tuple[int, str]]
+        self._next_suffix = {}  # type: Dict[Tuple[int, str], int]
 
     @staticmethod
     def _format_label(label: str):
-        return label.lower().replace(" ", "_")
+        return sys.intern(label.lower().replace(" ", "_"))
 
     def get_true_label(self, value: ZWaveValue):
         """
@@ -28,42 +40,42 @@ class Labels:
         :param value: ZWaveValue
         :return: New label
         """
-        label = self._format_label(value.label)
-        true_name = self._label_map.get(str(value.command_class) + str(value.value_id))
+        cc = value.command_class
+        key = (cc, value.value_id)
+        true_name = self._label_map.get(key)
         if not true_name:
-            while str(value.command_class) + label in self._taken_labels:
-                if label[-2] == "_":
-                    v = int(label[-1]) + 1
-                    label = label[:-2] + "_" + str(v)
-                elif label[-3] == "_":
-                    v = int(label[-2]) + 1
-                    label = label[:-3] + "_" + str(v)
-                else:
-                    label = label + "_2"
-            self._taken_labels.add(str(value.command_class) + label)
-            self._label_map[str(value.command_class) + str(value.value_id)] = label
+            base = self._format_label(value.label)
+            label = base
+            if (cc, label) in self._taken_labels:
+                # Continue from the last suffix given for this base label, loop only skips labels which
+                # happen to be taken verbatim (e.g. "temperature_2" reported by the device itself)
+                n = self._next_suffix.get((cc, base), 1)
+                while (cc, label) in self._taken_labels:
+                    n += 1
+                    label = sys.intern("%s_%i" % (base, n))
+                self._next_suffix[(cc, base)] = n
+            self._taken_labels.add((cc, label))
+            self._label_map[key] = label
             return label
         return true_name
 
 
 class Metrics:
+    __slots__ = ("_data", "_view", "_labels", "_ignore_list", "_dirty", "_last_metric_ts")
 
     def __init__(self, labels: Labels, ignored_labels: List[str]):
         self._data = {}
+        # Read-only view handed out to callers, no copy needed to protect the data
+        self._view = MappingProxyType(self._data)
         self._labels = labels
-        self._ignore_list = ignored_labels
+        self._ignore_list = frozenset(ignored_labels)
         self._dirty = False
         self._last_metric_ts = 0
 
     @staticmethod
     def _get_true_value(value):
-        if isinstance(value, float):
-            value = "%.2f" % value
-        elif isinstance(value, int):
-            value = "%i" % value
-        elif isinstance(value, bool):
-            value = "on" if value else "off"
-        return value
+        convert = _VALUE_CONVERTERS.get(type(value))
+        return convert(value) if convert else value
 
     def set_direct(self, key: str, new_value):
         old_value = self._data.get(key)
@@ -88,34 +100,42 @@ class Metrics:
                 self._data[label] = new_value
             self._dirty = True
 
-    def should_send(self):
+    def should_send(self, now: float):
         if len(self._data) == 0:
             return False
-        if self._dirty or time.time() - self._last_metric_ts > 120:
+        if self._dirty or now - self._last_metric_ts > 120:
             self._dirty = False
-            self._last_metric_ts = time.time()
+            self._last_metric_ts = now
             return True
         return False
 
-    def data(self):
-        return self._data
+    def data(self) -> Mapping:
+        return self._view
 
 
 class ZwNode:
+    __slots__ = ("_zwn", "_name", "_mqtt", "_spam_tick", "_labels", "_m", "_config", "_devices", "_cmds",
+                 "_metrics_cmd", "_config_template", "_cc_dispatch")
 
     def __init__(self, zwn: ZWaveNode, mqtt: HassMqtt, ignored_labels: List):
         self._zwn = zwn
+        self._name = zwn.name or str(zwn.node_id)
         self._mqtt = mqtt
-        self._spam_tick = (time.time(), 600)
+        self._spam_tick = (time.monotonic(), 600)
         self._labels = Labels()
         self._m = Metrics(self._labels, ignored_labels)
         self._config = dict()  # type: Dict[str, str]
         self._devices = {}
         self._cmds = {}
+        self._metrics_cmd = None  # type: Optional[HassSensor]
+        # Rendered config_template, cleared after devices and commands are registered
+        self._config_template = None  # type: Optional[str]
+        # Command class => handler for values not bound to a device
+        self._cc_dispatch = {cc: self._on_sensor for cc in SENSORS}
 
     @staticmethod
     def _scale_to_hass(data: int) -> int:
-        return int(data * 255 / 95)
+        return data * 255 // 95
 
     def get_data(self):
         return self._m.data()
@@ -123,8 +143,11 @@ class ZwNode:
     def devices(self):
         return self._devices
 
-    def name(self):
-        return self._zwn.name
+    def name(self) -> str:
+        """
+        Node name, or node id for unnamed nodes. Cached as node can't be renamed through the bridge.
+        """
+        return self._name
 
     def id(self):
         return self._zwn.node_id
@@ -132,18 +155,19 @@ class ZwNode:
     def model(self):
         return self._zwn.product_name
 
-    def metrics(self) -> Dict:
+    def metrics(self) -> Mapping:
         return self._m.data()
 
-    def config_template(self) -> Dict[str, List]:
+    def config_template(self) -> str:
+        if self._config_template is not None:
+            return self._config_template
         full_set = dict()
         for dev in itertools.chain(self._cmds.values(), self._devices.values()):
-            config = dev.generate_config()
-            for key in config.keys():
-                if key not in full_set:
-                    full_set[key] = []
-                full_set[key].extend(config[key])
-        return yaml.dump(full_set, default_flow_style=False).replace("\n", "<br>").replace(" ", "&nbsp;")
+            for key, entries in dev.generate_config().items():
+                full_set.setdefault(key, []).extend(entries)
+        rendered = yaml.dump(full_set, Dumper=_YAML_DUMPER, default_flow_style=False)
+        self._config_template = rendered.replace("\n", "<br>").replace(" ", "&nbsp;")
+        return self._config_template
 
     def zw_values(self):
         return self._zwn.get_values()
@@ -151,7 +175,7 @@ class ZwNode:
     def registration_state(self) -> str:
         if len(self._devices) > 0:
             return "Actionable"
-        if self._cmds.get("metrics"):
+        if self._metrics_cmd:
             return "Sensor"
         return "-"
 
@@ -163,13 +187,16 @@ class ZwNode:
         self._zwn.set_config_param(int(value_id), value)
         LOG.info("Setting %r = %r", value_id, value)
 
-    def is_spamming(self) -> bool:
+    def is_spamming(self, now: float) -> bool:
+        """
+        :param now: Time of the update (time.monotonic()), read once by the caller for the whole update
+        """
         last_time, count = self._spam_tick
-        intervals = int((time.time() - last_time))
+        intervals = int((now - last_time))
         if intervals > 10:
             count += intervals
             count = min(count, 100)
-            last_time = int(time.time())
+            last_time = now
         if count > 0:
             count -= 1
             if count == 0:
@@ -179,29 +206,28 @@ class ZwNode:
         self._spam_tick = (last_time, count)
         return count == 0
 
-    def _collect_initial_sensor_data(self):
+    def _collect_initial_sensor_data(self, values: Dict[int, ZWaveValue]):
         """
-        Send all sensor data, return true if something was relayed forward
-        :return: True if data was sent
+        Collect initial metric data from the given node values
+        :param values: Node values by value id, as fetched for registration
         """
-        values = self._zwn.get_sensors()
-        values.update(self._zwn.get_values_for_command_class(COMMAND_CLASS_NOTIFICATION))
-        values.update(self._zwn.get_usercodes())
-        values.update(self._zwn.get_battery_levels())
-        for s_id, v in self._zwn.get_values().items():
-            # v = self._zwn.values[s_id]  # type: ZWaveValue
+        for s_id, v in values.items():
             self._m.set_from_value(v)
 
     def _mqtt_metrics_send(self):
-        LOG.debug("Sending metrics for %r: %r ", self._zwn.name, self._m.data())
-        LOG.info("Sending metrics for %r: %r ", self._zwn.name, len(self._m.data()))
-        self._mqtt.send_metrics(self._cmds.get("metrics"), self._m.data())
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("Sending metrics for %r: %r ", self._zwn.name, self._m.data())
+        if LOG.isEnabledFor(logging.INFO):
+            LOG.info("Sending metrics for %r: %r ", self._zwn.name, len(self._m.data()))
+        self._mqtt.send_metrics(self._metrics_cmd, self._m.data())
 
     def register(self, hass_mqtt: HassMqtt):
         self.__register_devices(self._zwn.get_switches(), SwitchDevice, hass_mqtt)
         self.__register_devices(self._zwn.get_dimmers(), DimmerDevice, hass_mqtt)
         self.__register_devices(self._zwn.get_rgbbulbs(), RgbDevice, hass_mqtt)
         self._register_sensors()
+        # Cleared only when done, a page rendered meanwhile would otherwise keep a partial template
+        self._config_template = None
 
     def _register_sensors(self) -> bool:
         """
@@ -209,16 +235,14 @@ class ZwNode:
         """
         cmd = self._mqtt.register_metrics(self._zwn.location, self._zwn.name)
         self._cmds["metrics"] = cmd
+        self._metrics_cmd = cmd
         values = self._zwn.get_values()
-#        values = self._zwn.get_sensors()
-#        values.update(self._zwn.get_values_for_command_class(COMMAND_CLASS_NOTIFICATION))
-#        values.update(self._zwn.get_usercodes())
-#        values.update(self._zwn.get_battery_levels())
-        for s_id, v in self._zwn.get_values().items():
+        for s_id, v in values.items():
             #v = self._zwn.values[s_id]  # type: ZWaveValue
-            cmd.add_metric(self._labels.get_true_label(v))
-            LOG.debug("[%s] New Sensor %s", self._zwn.name, self._labels.get_true_label(v))
-        self._collect_initial_sensor_data()
+            label = self._labels.get_true_label(v)
+            cmd.add_metric(label)
+            LOG.debug("[%s] New Sensor %s", self._zwn.name, label)
+        self._collect_initial_sensor_data(values)
         return True
 
     def __register_devices(self, sids: List[int], device_type, hass_mqtt):
@@ -226,21 +250,27 @@ class ZwNode:
             if s_id in self._devices:
                 continue
             v = self._zwn.values[s_id]  # type: ZWaveValue
-            LOG.info("Registering %s / %s", self._zwn.name, self._labels.get_true_label(v))
-            self._devices[s_id] = device_type(self._labels.get_true_label(v), self._zwn, hass_mqtt, s_id)
+            label = self._labels.get_true_label(v)
+            LOG.info("Registering %s / %s", self._zwn.name, label)
+            self._devices[s_id] = device_type(label, self._zwn, hass_mqtt, s_id)
 
-    def update_state(self, value: ZWaveValue) -> bool:
+    def update_state(self, value: ZWaveValue, now: float) -> bool:
         dev = self._devices.get(value.value_id)
         if dev:
             dev.zwave_message(value)
             return True
-        if value.command_class in SENSORS:
-            LOG.debug("Sensor data, %s => %s=%r", self.name(), value.label, value.data)
-            self._m.set_from_value(value)
-            if self._m.should_send():
-                self._mqtt_metrics_send()
-            return True
+        handler = self._cc_dispatch.get(value.command_class)
+        if handler:
+            return handler(value, now)
         return False
 
+    def _on_sensor(self, value: ZWaveValue, now: float) -> bool:
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("Sensor data, %s => %s=%r", self._name, value.label, value.data)
+        self._m.set_from_value(value)
+        if self._m.should_send(now):
+            self._mqtt_metrics_send()
+        return True
+
     def get_raw_zwn(self) -> ZWaveNode:
         return self._zwn